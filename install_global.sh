@@ -76,6 +76,7 @@ mkdir -p "$INSTALL_DIR"
 # Copy core files
 echo -e "${BLUE}Installing MCP dispatcher files...${NC}"
 cp mcp_dispatcher.py "$INSTALL_DIR/"
+cp mcp_dispatcher_fast.py "$INSTALL_DIR/"
 cp mcp_dispatcher_exec.py "$INSTALL_DIR/mcp-dispatcher-exec"
 cp test_mcp_dispatcher.py "$INSTALL_DIR/"
 
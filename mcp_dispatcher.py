@@ -12,14 +12,23 @@ This dispatcher allows you to:
 import json
 import os
 import sys
-import subprocess
-import argparse
-import fnmatch
-import platform
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+import functools
+from typing import Dict, List, Optional
 import logging
 
+from mcp_dispatcher_fast import (
+    GLOB_CHARS,
+    absolute_path,
+    build_path_index,
+    dump_config,
+    match_key,
+    match_path_index,
+    normalize_path,
+    parse_config,
+    read_config_cache,
+    write_config_cache,
+)
+
 class MCPDispatcher:
     def __init__(self, config_file: str = None):
         # Priority order: explicit config_file -> MCP_DISPATCHER_CONFIG env var -> local config.json -> default config
@@ -34,9 +43,19 @@ class MCPDispatcher:
         
         self.config = self._load_config()
         self.logger = self._setup_logging()
+        # Memoized path -> mapping lookups; cleared whenever the index is rebuilt
+        self._resolve = functools.lru_cache(maxsize=128)(self._match_path_index)
+        if self._path_index is None:
+            self._build_path_index()
+            self._write_config_cache(self._config_stat)
+        else:
+            self._index_fast_paths()
+        # The dispatcher never changes directory, so the cwd is resolved only once
+        self._cwd_cache: Optional[str] = None
     
     def _get_default_config_path(self) -> str:
         """Get platform-specific default config path"""
+        import platform
         system = platform.system().lower()
         
         if system == "windows":
@@ -62,14 +81,26 @@ class MCPDispatcher:
         return logger
     
     def _load_config(self) -> Dict:
-        """Load configuration from JSON file"""
-        if not os.path.exists(self.config_file):
+        """Load configuration from JSON file, or from its cache when unchanged"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
             self._show_config_error()
             sys.exit(1)
+        
+        self._path_index = None
+        # Taken before reading, so the cache is keyed to what was parsed
+        self._config_stat = stat
+        cached = read_config_cache(self.config_file, stat)
+        if cached is not None:
+            config, self._path_index = cached
+            # The exec wrapper writes this cache too and does not validate
+            if not self._validate_config(config):
+                sys.exit(1)
+            return config
             
         try:
-            with open(self.config_file, 'r') as f:
-                config = json.load(f)
+            config = parse_config(self.config_file)
                 
             # Validate configuration
             if not self._validate_config(config):
@@ -81,6 +112,10 @@ class MCPDispatcher:
             print("Please check your configuration file syntax and try again.")
             sys.exit(1)
     
+    def _write_config_cache(self, stat: os.stat_result = None):
+        """Cache the validated config and its path index next to the config file"""
+        write_config_cache(self.config_file, self.config, self._path_index, stat)
+    
     def _show_config_error(self):
         """Show helpful error message when config is missing"""
         print("❌ Configuration file not found!")
@@ -137,44 +172,83 @@ class MCPDispatcher:
     def _save_config(self):
         """Save configuration to JSON file"""
         try:
-            os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            config_dir = os.path.dirname(self.config_file)
+            if config_dir:
+                os.makedirs(config_dir, exist_ok=True)
+            dump_config(self.config_file, self.config)
             self.logger.info(f"Configuration saved to {self.config_file}")
+            self._write_config_cache()
         except IOError as e:
             self.logger.error(f"Error saving config: {e}")
     
+    def _build_path_index(self):
+        """Index path mappings for dispatch (see mcp_dispatcher_fast.build_path_index)"""
+        self._path_index = build_path_index(self.config.get("path_mappings", []))
+        self._resolve.cache_clear()
+        self._index_fast_paths()
+    
+    def _index_fast_paths(self):
+        """Precompute shortcuts for configs with no mappings or a single literal one"""
+        mappings = self.config.get("path_mappings", [])
+        self._num_mappings = len(mappings)
+        self._single_literal = None
+        if self._num_mappings == 1:
+            pattern = mappings[0]["path_pattern"]
+            if not any(c in pattern for c in GLOB_CHARS):
+                # A literal fnmatch pattern only matches that exact path
+                self._single_literal = (match_key(normalize_path(pattern)), mappings[0])
+    
+    def _match_path_index(self, current_path: str) -> Optional[Dict]:
+        """Return the first mapping whose pattern matches the normalized path"""
+        return match_path_index(self._path_index, current_path)
+    
     def find_matching_server(self, current_path: str = None) -> Dict:
         """Find the MCP server that matches the current directory path"""
-        if current_path is None:
-            current_path = os.getcwd()
+        if self._num_mappings == 0:
+            # Nothing to match against, so skip resolving the path at all
+            return self._default_server()
         
-        current_path = os.path.abspath(current_path)
-        # Normalize path separators for cross-platform compatibility
-        current_path = self._normalize_path(current_path)
+        if current_path is None:
+            current_path = self._get_cwd()
+        else:
+            current_path = absolute_path(current_path)
+            # Normalize path separators for cross-platform compatibility
+            current_path = self._normalize_path(current_path)
         self.logger.info(f"Looking for MCP server for path: {current_path}")
         
-        # Check each path mapping
-        for mapping in self.config.get("path_mappings", []):
-            pattern = mapping["path_pattern"]
-            normalized_pattern = self._normalize_path(pattern)
-            if fnmatch.fnmatch(current_path, normalized_pattern):
-                self.logger.info(f"Matched pattern '{pattern}' -> {mapping['mcp_server']['name']}")
-                return mapping["mcp_server"]
+        if self._single_literal is not None:
+            literal, mapping = self._single_literal
+            if match_key(current_path) != literal:
+                mapping = None
+        else:
+            mapping = self._resolve(current_path)
+        if mapping is not None:
+            self.logger.info(f"Matched pattern '{mapping['path_pattern']}' -> {mapping['mcp_server']['name']}")
+            return mapping["mcp_server"]
         
         # Return default server if no match found
+        return self._default_server()
+    
+    def _default_server(self) -> Dict:
+        """Return the default server, used when no path mapping matches"""
         default_server = self.config.get("default_mcp_server")
         self.logger.info(f"No pattern matched, using default: {default_server['name']}")
         return default_server
     
+    def _get_cwd(self) -> str:
+        """Return the normalized current working directory, resolved once per process"""
+        if self._cwd_cache is None:
+            self._cwd_cache = self._normalize_path(os.path.abspath(os.getcwd()))
+        return self._cwd_cache
+    
     def _normalize_path(self, path: str) -> str:
         """Normalize path for cross-platform compatibility"""
         # Convert to forward slashes for consistent pattern matching
         # fnmatch works with forward slashes on all platforms
-        return path.replace(os.sep, '/')
+        return normalize_path(path)
     
-    def add_path_mapping(self, path_pattern: str, server_name: str, command: str, args: List[str], description: str = ""):
-        """Add a new path mapping"""
+    def add_path_mapping(self, path_pattern: str, server_name: str, command: str, args: List[str], description: str = "", save: bool = True):
+        """Add a new path mapping; pass save=False to batch several before _save_config()"""
         new_mapping = {
             "path_pattern": path_pattern,
             "mcp_server": {
@@ -189,7 +263,9 @@ class MCPDispatcher:
             self.config["path_mappings"] = []
         
         self.config["path_mappings"].append(new_mapping)
-        self._save_config()
+        self._build_path_index()
+        if save:
+            self._save_config()
         self.logger.info(f"Added mapping: {path_pattern} -> {server_name}")
     
     def remove_path_mapping(self, path_pattern: str) -> bool:
@@ -204,6 +280,7 @@ class MCPDispatcher:
         ]
         
         if len(self.config["path_mappings"]) < original_count:
+            self._build_path_index()
             self._save_config()
             self.logger.info(f"Removed mapping for pattern: {path_pattern}")
             return True
@@ -211,25 +288,27 @@ class MCPDispatcher:
     
     def list_mappings(self):
         """List all path mappings"""
-        print("Current MCP Path Mappings:")
-        print("=" * 50)
+        # Built up front and written at once rather than print()ed line by line
+        lines = ["Current MCP Path Mappings:", "=" * 50]
         
         if "path_mappings" in self.config and self.config["path_mappings"]:
             for i, mapping in enumerate(self.config["path_mappings"], 1):
                 server = mapping["mcp_server"]
-                print(f"{i}. Pattern: {mapping['path_pattern']}")
-                print(f"   Server: {server['name']}")
-                print(f"   Command: {server['command']} {' '.join(server['args'])}")
-                print(f"   Description: {server.get('description', 'N/A')}")
-                print()
+                args = ' '.join(server['args'])
+                lines.append(f"{i}. Pattern: {mapping['path_pattern']}")
+                lines.append(f"   Server: {server['name']}")
+                lines.append(f"   Command: {server['command']} {args}")
+                lines.append(f"   Description: {server.get('description', 'N/A')}")
+                lines.append("")
         else:
-            print("No path mappings configured.")
+            lines.append("No path mappings configured.")
         
-        print("Default Server:")
+        lines.append("Default Server:")
         default = self.config.get("default_mcp_server", {})
-        print(f"   Server: {default.get('name', 'N/A')}")
-        print(f"   Command: {default.get('command', 'N/A')} {' '.join(default.get('args', []))}")
-        print(f"   Description: {default.get('description', 'N/A')}")
+        lines.append(f"   Server: {default.get('name', 'N/A')}")
+        lines.append(f"   Command: {default.get('command', 'N/A')} {' '.join(default.get('args', []))}")
+        lines.append(f"   Description: {default.get('description', 'N/A')}")
+        sys.stdout.write('\n'.join(lines) + '\n')
     
     def test_current_path(self, test_path: str = None):
         """Test which server would be selected for current or specified path"""
@@ -241,6 +320,32 @@ class MCPDispatcher:
         print(f"Command: {server['command']} {' '.join(server['args'])}")
         print(f"Description: {server.get('description', 'N/A')}")
     
+    def serve_batch(self):
+        """Answer JSON-lines requests on stdin with one JSON line each on stdout"""
+        # Keeps one dispatcher resident for callers (such as test-install) that
+        # would otherwise start a new CLI process for every query
+        for line in iter(sys.stdin.readline, ""):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                command = request.get("command")
+                if command == "test":
+                    path = request.get("path") or os.getcwd()
+                    reply = {"ok": True, "path": path, "server": self.find_matching_server(path)}
+                elif command == "list":
+                    reply = {
+                        "ok": True,
+                        "path_mappings": self.config.get("path_mappings", []),
+                        "default_mcp_server": self.config.get("default_mcp_server"),
+                    }
+                else:
+                    reply = {"ok": False, "error": f"Unknown command: {command}"}
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            sys.stdout.write(json.dumps(reply) + "\n")
+            sys.stdout.flush()
+    
     def start_server(self, path: str = None):
         """Start the appropriate MCP server for the current or specified path"""
         server = self.find_matching_server(path)
@@ -248,16 +353,18 @@ class MCPDispatcher:
         print(f"Starting MCP server: {server['name']}")
         print(f"Command: {server['command']} {' '.join(server['args'])}")
         
+        # Replace this process with the MCP server (as mcp-dispatcher-exec does),
+        # so the dispatcher does not stay resident as its parent
+        cmd = [server['command']] + server['args']
+        sys.stdout.flush()
         try:
-            # Execute the MCP server command
-            cmd = [server['command']] + server['args']
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Error starting MCP server: {e}")
-            sys.exit(1)
+            os.execvp(cmd[0], cmd)
         except FileNotFoundError as e:
             self.logger.error(f"MCP server command not found: {e}")
             sys.exit(1)
+        except OSError as e:
+            self.logger.error(f"Error starting MCP server: {e}")
+            sys.exit(1)
     
     def enable_in_current_directory(self):
         """Enable MCP dispatcher in current directory by copying .mcp.json"""
@@ -298,6 +405,10 @@ class MCPDispatcher:
             return False
 
 def main():
+    # CLI-only modules are imported here so importing MCPDispatcher stays cheap
+    import argparse
+    import subprocess
+    
     parser = argparse.ArgumentParser(description="Smart MCP Dispatcher")
     parser.add_argument("--config", help="Configuration file path")
     
@@ -320,12 +431,15 @@ def main():
     
     # Test command
     test_parser = subparsers.add_parser("test", help="Test which server would be selected")
-    test_parser.add_argument("--path", help="Path to test (defaults to current directory)")
+    test_parser.add_argument("--path", action="append", help="Path to test, may be repeated (defaults to current directory)")
     
     # Start server command
     start_parser = subparsers.add_parser("start", help="Start the appropriate MCP server")
     start_parser.add_argument("--path", help="Path to determine server (defaults to current directory)")
     
+    # Batch command
+    subparsers.add_parser("batch", help="Answer JSON-lines test/list requests on stdin")
+    
     # Help command
     subparsers.add_parser("help", help="Show help information")
     
@@ -365,11 +479,18 @@ def main():
         dispatcher.list_mappings()
     
     elif args.command == "test":
-        dispatcher.test_current_path(args.path)
+        # Several paths are tested in one run, separated by blank lines
+        for i, path in enumerate(args.path or [None]):
+            if i:
+                print()
+            dispatcher.test_current_path(path)
     
     elif args.command == "start":
         dispatcher.start_server(args.path)
     
+    elif args.command == "batch":
+        dispatcher.serve_batch()
+    
     elif args.command == "help":
         parser.print_help()
     
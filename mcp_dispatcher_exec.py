@@ -7,16 +7,17 @@ and then directly executes it (replacing the current process)
 
 import os
 import sys
-import json
-import subprocess
-import fnmatch
 
-def normalize_path(path: str) -> str:
-    """Normalize path for cross-platform compatibility"""
-    return path.replace(os.sep, '/')
+from mcp_dispatcher_fast import (
+    build_path_index,
+    parse_config,
+    read_config_cache,
+    resolve_server,
+    write_config_cache,
+)
 
 def load_config():
-    """Load MCP dispatcher configuration"""
+    """Load MCP dispatcher configuration and its path index"""
     # Try to find config file
     config_file = None
     
@@ -33,38 +34,29 @@ def load_config():
         sys.exit(1)
     
     try:
-        with open(config_file, 'r') as f:
-            return json.load(f)
+        # Reuse the cached config and index while the config file is unchanged
+        stat = os.stat(config_file)
+        cached = read_config_cache(config_file, stat)
+        if cached is not None:
+            return cached
+        config = parse_config(config_file)
     except Exception as e:
         print(f"❌ Error loading config: {e}", file=sys.stderr)
         sys.exit(1)
-
-def find_matching_server(config, current_path=None):
-    """Find the MCP server that matches the current directory path"""
-    if current_path is None:
-        current_path = os.getcwd()
-    
-    current_path = os.path.abspath(current_path)
-    current_path = normalize_path(current_path)
-    
-    # Check each path mapping
-    for mapping in config.get("path_mappings", []):
-        pattern = mapping["path_pattern"]
-        normalized_pattern = normalize_path(pattern)
-        if fnmatch.fnmatch(current_path, normalized_pattern):
-            return mapping["mcp_server"]
     
-    # Return default server if no match found
-    return config.get("default_mcp_server")
+    path_index = build_path_index(config.get("path_mappings", []))
+    write_config_cache(config_file, config, path_index, stat)
+    return config, path_index
 
 def main():
     """Main function to determine and execute the appropriate MCP server"""
     try:
         # Load configuration
-        config = load_config()
+        config, path_index = load_config()
         
-        # Get the appropriate server for current directory
-        server_config = find_matching_server(config)
+        # Claude Code reports its working directory through PWD
+        current_path = os.environ.get('PWD') or os.getcwd()
+        server_config = resolve_server(config, path_index, current_path)
         
         if not server_config:
             print("❌ No MCP server configured", file=sys.stderr)
@@ -73,22 +65,22 @@ def main():
         # Prepare command
         cmd = [server_config['command']] + server_config['args']
         
-        # Prepare environment - this is critical!
-        env = os.environ.copy()
+        # Prepare environment - this is critical! This process is replaced by the
+        # server, so the server env is applied in place rather than to a copy.
         if 'env' in server_config:
-            env.update(server_config['env'])
+            os.environ.update(server_config['env'])
         
         # Debug logging
         print(f"🚀 Starting MCP server: {server_config['name']}", file=sys.stderr)
-        print(f"📂 Working directory: {os.getcwd()}", file=sys.stderr)
+        print(f"📂 Working directory: {current_path}", file=sys.stderr)
         print(f"💻 Command: {' '.join(cmd)}", file=sys.stderr)
         
         # Execute the MCP server by replacing current process
-        os.execvpe(cmd[0], cmd, env)
+        os.execvp(cmd[0], cmd)
         
     except Exception as e:
         print(f"❌ Error starting MCP server: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
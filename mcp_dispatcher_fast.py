@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+MCP Dispatcher Fast Path - Config loading and path matching shared by the CLI and exec wrapper
+
+This module is imported on every Claude Code startup by mcp-dispatcher-exec, so it
+only uses the standard library and imports the heavier pieces (orjson/json, fnmatch)
+lazily: a warm config cache needs none of them.
+"""
+
+import marshal
+import os
+
+# Characters that make fnmatch treat a pattern as a glob rather than a literal
+GLOB_CHARS = "*?["
+
+# How an indexed pattern suffix is compared against the rest of the path
+MATCH_EXACT, MATCH_PREFIX, MATCH_GLOB = range(3)
+
+# fnmatch.fnmatch normalizes case on case-insensitive filesystems (Windows)
+CASE_INSENSITIVE = os.path.normcase("A") == "a"
+
+# Only platforms with a different separator need paths rewritten before matching
+NEEDS_SEP_NORMALIZE = os.sep != '/'
+_SEP_TRANS = str.maketrans(os.sep, '/') if NEEDS_SEP_NORMALIZE else None
+
+# Parsed config + path index are cached next to the config file; bump the
+# version whenever the index layout changes. The cache is plain marshal data
+# (no pickle): config.json may come from an untrusted checkout, and loading
+# the cache must never run code.
+CONFIG_CACHE_SUFFIX = ".cache.marshal"
+CONFIG_CACHE_VERSION = 2
+
+def normalize_path(path: str) -> str:
+    """Normalize path for cross-platform compatibility"""
+    # Convert to forward slashes for consistent pattern matching
+    return path if _SEP_TRANS is None else path.translate(_SEP_TRANS)
+
+def absolute_path(path: str) -> str:
+    """Make a path absolute, skipping os.path.abspath when it already is normalized"""
+    # getcwd() and PWD are already absolute and normalized; abspath would only copy them.
+    # Anything that abspath could still change (relative, "//", "/.", trailing slash,
+    # or a Windows path) takes the slow path.
+    if (not NEEDS_SEP_NORMALIZE and path.startswith('/') and not path.endswith('/')
+            and '//' not in path and '/.' not in path):
+        return path
+    return os.path.abspath(path)
+
+def match_key(path: str) -> str:
+    """Fold case the way fnmatch does on case-insensitive platforms"""
+    return path.lower() if CASE_INSENSITIVE else path
+
+def parse_config(config_file: str) -> dict:
+    """Parse the JSON config file"""
+    # orjson is optional; it parses the config noticeably faster than the stdlib
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+    if orjson is not None:
+        with open(config_file, 'rb') as f:
+            return orjson.loads(f.read())
+    import json
+    with open(config_file, 'r') as f:
+        return json.load(f)
+
+def dump_config(config_file: str, config: dict):
+    """Write the config as indented JSON"""
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+    if orjson is not None:
+        with open(config_file, 'wb') as f:
+            f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+        return
+    import json
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=2)
+
+def config_cache_key(stat: os.stat_result) -> tuple:
+    return (CONFIG_CACHE_VERSION, CASE_INSENSITIVE, stat.st_mtime_ns, stat.st_size)
+
+def _plain_index(node: dict) -> dict:
+    """Copy a path index as plain data: glob regexes as patterns, mappings as positions"""
+    plain = {}
+    for part, child in node.items():
+        if part is None:
+            plain[None] = [
+                (index, kind, value.pattern if kind == MATCH_GLOB else value)
+                for index, kind, value, _ in child
+            ]
+        else:
+            plain[part] = _plain_index(child)
+    return plain
+
+def _restore_index(plain: dict, path_mappings: list) -> dict:
+    """Rebuild a path index from _plain_index data, recompiling the glob regexes"""
+    import re
+    
+    node = {}
+    for part, child in plain.items():
+        if part is None:
+            entries = []
+            for index, kind, value in child:
+                if kind == MATCH_GLOB:
+                    value = re.compile(value)
+                entries.append((index, kind, value, path_mappings[index]))
+            node[None] = entries
+        else:
+            node[part] = _restore_index(child, path_mappings)
+    return node
+
+def read_config_cache(config_file: str, stat: os.stat_result):
+    """Return (config, path_index) from the cache if it matches the config file"""
+    try:
+        with open(config_file + CONFIG_CACHE_SUFFIX, 'rb') as f:
+            key, config, plain_index = marshal.load(f)
+        if key != config_cache_key(stat):
+            return None
+        return config, _restore_index(plain_index, config.get("path_mappings", []))
+    except Exception:
+        return None
+
+def write_config_cache(config_file: str, config: dict, path_index: dict, stat: os.stat_result = None):
+    """Cache the config and its path index next to the config file"""
+    # Callers that parsed the file pass the stat taken before reading it, so
+    # a save landing after the read leaves a cache that no longer matches
+    # rather than the old content under the new file's key
+    cache_file = config_file + CONFIG_CACHE_SUFFIX
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        key = config_cache_key(stat or os.stat(config_file))
+        with open(tmp_file, 'wb') as f:
+            marshal.dump((key, config, _plain_index(path_index)), f)
+        os.replace(tmp_file, cache_file)
+    except (OSError, ValueError):
+        # Read-only config directory (or a value marshal cannot store): run
+        # without the cache
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+def build_path_index(path_mappings: list) -> dict:
+    """Index path mappings into a trie keyed on their literal leading directories"""
+    # Each pattern is split at its first glob character. The directories in the
+    # literal part become trie keys, so a lookup only has to test the mappings
+    # whose literal prefix lies on the current path. Leaves keep the mapping's
+    # position so the first configured match still wins.
+    import fnmatch
+    import re
+    
+    root = {}
+    for index, mapping in enumerate(path_mappings):
+        pattern = match_key(normalize_path(mapping["path_pattern"]))
+        glob_at = min((pattern.find(c) for c in GLOB_CHARS if c in pattern), default=-1)
+        literal = pattern if glob_at < 0 else pattern[:glob_at]
+        dir_prefix = literal[:literal.rfind('/') + 1]
+        
+        node = root
+        for part in dir_prefix.split('/')[:-1]:
+            node = node.setdefault(part, {})
+        suffix = pattern[len(dir_prefix):]
+        if glob_at < 0:
+            kind, value = MATCH_EXACT, suffix
+        elif glob_at == len(pattern) - 1 and pattern[-1] == '*':
+            # "literal*" only needs a prefix test, no regex
+            kind, value = MATCH_PREFIX, suffix[:-1]
+        else:
+            kind, value = MATCH_GLOB, re.compile(fnmatch.translate(suffix))
+        node.setdefault(None, []).append((index, kind, value, mapping))
+    return root
+
+def match_path_index(path_index: dict, current_path: str):
+    """Return the first mapping whose pattern matches the normalized path, or None"""
+    key = match_key(current_path)
+    
+    # Collect the mappings whose literal prefix lies on the current path
+    candidates = []
+    node = path_index
+    offset = 0
+    for part in key.split('/'):
+        for entry in node.get(None, ()):
+            candidates.append((entry, offset))
+        node = node.get(part)
+        if node is None:
+            break
+        offset += len(part) + 1
+    
+    # First configured mapping that matches wins
+    candidates.sort(key=lambda candidate: candidate[0][0])
+    for (_, kind, value, mapping), offset in candidates:
+        residual = key[offset:]
+        if kind == MATCH_PREFIX:
+            matched = residual.startswith(value)
+        elif kind == MATCH_EXACT:
+            matched = residual == value
+        else:
+            matched = value.match(residual) is not None
+        if matched:
+            return mapping
+    return None
+
+def resolve_server(config: dict, path_index: dict, current_path: str):
+    """Find the MCP server for a path, falling back to the default server"""
+    if not path_index:
+        # No mappings: the path does not need resolving
+        return config.get("default_mcp_server")
+    mapping = match_path_index(path_index, normalize_path(absolute_path(current_path)))
+    if mapping is not None:
+        return mapping["mcp_server"]
+    return config.get("default_mcp_server")
@@ -4,32 +4,28 @@ MCP Proxy Server - A proper MCP server that forwards requests to the selected ba
 """
 
 import asyncio
-import json
 import logging
 import os
 import sys
-from typing import Any, Dict, List, Optional, Sequence
-import subprocess
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 # Import MCP types and utilities
 try:
+    import anyio
     from mcp import ClientSession, StdioServerParameters
     from mcp.client.stdio import stdio_client
-    from mcp.server import Server
+    from mcp.server import NotificationOptions, Server
     from mcp.server.models import InitializationOptions
     import mcp.server.stdio
     from mcp.types import (
         Tool, 
         TextContent, 
-        ImageContent, 
-        EmbeddedResource,
-        CallToolRequest,
         CallToolResult,
-        ListToolsRequest,
-        ListPromptsRequest,
-        GetPromptRequest,
+        GetPromptResult,
         PromptMessage,
-        Prompt
+        Prompt,
+        ServerCapabilities
     )
 except ImportError:
     print("MCP library not found. Please install with: pip install mcp")
@@ -37,108 +33,417 @@ except ImportError:
 
 from mcp_dispatcher import MCPDispatcher
 
+# Identity the proxy reports to Claude Code during initialization
+SERVER_NAME = "smart-mcp-dispatcher"
+SERVER_VERSION = "1.0.0"
+
+# (Server decorator factory, decorator kwargs, MCPProxyServer method) for each
+# request the proxy forwards; call_tool skips input validation because the
+# backend validates its own tool arguments
+HANDLERS = (
+    ("list_tools", {}, "list_tools"),
+    ("call_tool", {"validate_input": False}, "call_tool"),
+    ("list_prompts", {}, "list_prompts"),
+    ("get_prompt", {}, "get_prompt"),
+)
+
+# Backend servers kept running at once; the least recently used one is shut
+# down when another is started
+MAX_BACKEND_SESSIONS = 4
+
+# Seconds a backend server gets to answer the MCP handshake; a server that
+# hangs on startup fails only the request that started it
+BACKEND_START_TIMEOUT = 60
+
+# Seconds a backend being shut down waits for its in-flight requests; the ones
+# still unanswered then fail so their callers are not left waiting
+BACKEND_DRAIN_TIMEOUT = 60
+
+# Number of working directories whose resolved server is remembered
+CWD_CACHE_SIZE = 32
+
+class BackendConnection:
+    """A backend MCP server session, kept open by a task that owns its transport
+    
+    stdio_client and ClientSession must be exited by the task that entered them,
+    but every proxied request runs in its own task, so each backend lives in a
+    dedicated task until close() is called.
+    """
+    
+    def __init__(self, key: Tuple, params: StdioServerParameters):
+        self.key = key
+        self.params = params
+        self.session: Optional[ClientSession] = None
+        self.logger = logging.getLogger('mcp_proxy_server')
+        self._ready: Optional[asyncio.Future] = None
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # What the server advertised in its initialize result
+        self.capabilities: Optional[ServerCapabilities] = None
+        # Tools and prompts are listed once at startup; None if that failed or
+        # the server announces changes to the listing (listChanged)
+        self.tools: Optional[List[Tool]] = None
+        self.prompts: Optional[List[Prompt]] = None
+        self._listed = asyncio.Event()
+        # Requests sent to the backend and not yet answered, each in its own
+        # task so a shutdown that stops waiting for them can fail them
+        self._requests: set = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Set once close() starts; no new request is sent from then on
+        self._retired = False
+        self._aborted = False
+    
+    async def start(self, timeout: float) -> ClientSession:
+        """Spawn the backend server and wait (up to timeout seconds) for the MCP handshake"""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Backend MCP server {self.key[0]} did not initialize within {timeout}s"
+            ) from None
+    
+    async def _run(self):
+        try:
+            async with stdio_client(self.params) as (read_stream, write_stream):
+                relay_send, relay_receive = anyio.create_memory_object_stream(0)
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(self._relay, read_stream, relay_send)
+                    async with ClientSession(relay_receive, write_stream) as session:
+                        initialized = await session.initialize()
+                        self.capabilities = initialized.capabilities
+                        self.session = session
+                        self._ready.set_result(session)
+                        prefetch = asyncio.ensure_future(self._prefetch(session))
+                        try:
+                            await self._closing.wait()
+                        finally:
+                            prefetch.cancel()
+                    tg.cancel_scope.cancel()
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                self.logger.error(f"Backend MCP server {self.key[0]} failed: {e}")
+        finally:
+            # A backend that exits on its own is no longer reusable
+            self.session = None
+            if not self._ready.done():
+                self._ready.cancel()
+            self._listed.set()
+    
+    async def _relay(self, read_stream, relay_send):
+        """Forward backend messages to the session, noticing when the server exits"""
+        # The backend's stdout reaches EOF as soon as its process exits, so this
+        # retires the connection (and lets stdio_client reap the child) right
+        # away instead of leaving a dead session in the pool
+        try:
+            async with relay_send:
+                async for message in read_stream:
+                    await relay_send.send(message)
+        except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+            return
+        if not self._closing.is_set():
+            self.logger.warning(f"Backend MCP server {self.key[0]} exited")
+            self.session = None
+            # Closing the relay ends the session's receive loop, which fails the
+            # pending requests with "Connection closed"; leaving the session
+            # earlier would cancel that loop and leave their callers waiting
+            await self._idle.wait()
+            self._closing.set()
+    
+    async def _prefetch(self, session: ClientSession):
+        """List tools and prompts together while the first request is on its way"""
+        # Listings the server did not advertise are known to be empty, so they
+        # are never requested (and never retried); listings it may change at
+        # runtime are always asked for live
+        fetches = {}
+        if self.capabilities.tools is None:
+            self.tools = []
+        elif self._cacheable("tools"):
+            fetches["tools"] = session.list_tools()
+        if self.capabilities.prompts is None:
+            self.prompts = []
+        elif self._cacheable("prompts"):
+            fetches["prompts"] = session.list_prompts()
+        
+        results = await asyncio.gather(*fetches.values(), return_exceptions=True)
+        for listing, result in zip(fetches, results):
+            if isinstance(result, Exception):
+                self.logger.warning(f"Prefetching {listing} from {self.key[0]} failed: {result}")
+            else:
+                setattr(self, listing, getattr(result, listing))
+        self._listed.set()
+    
+    async def call(self, method: str, *args):
+        """Send a request on the live session, counting it as in flight until it is answered"""
+        session = self.session
+        if session is None or self._retired:
+            raise ConnectionError(f"Backend MCP server {self.key[0]} is not running")
+        request = asyncio.ensure_future(getattr(session, method)(*args))
+        self._requests.add(request)
+        self._idle.clear()
+        try:
+            return await request
+        except asyncio.CancelledError:
+            if self._aborted:
+                raise ConnectionError(
+                    f"Backend MCP server {self.key[0]} was shut down before answering"
+                ) from None
+            raise
+        finally:
+            self._requests.discard(request)
+            if not self._requests:
+                self._idle.set()
+    
+    def _cacheable(self, listing: str) -> bool:
+        """Whether a listing stays fixed: the server does not advertise listChanged for it"""
+        capability = getattr(self.capabilities, listing, None)
+        return capability is None or not capability.listChanged
+    
+    async def list_tools(self) -> List[Tool]:
+        """Tools of the backend, asking it again if they were not cached"""
+        await self._listed.wait()
+        if self.tools is not None:
+            return self.tools
+        tools = (await self.call("list_tools")).tools
+        if self._cacheable("tools"):
+            self.tools = tools
+        return tools
+    
+    async def list_prompts(self) -> List[Prompt]:
+        """Prompts of the backend, asking it again if they were not cached"""
+        await self._listed.wait()
+        if self.prompts is not None:
+            return self.prompts
+        prompts = (await self.call("list_prompts")).prompts
+        if self._cacheable("prompts"):
+            self.prompts = prompts
+        return prompts
+    
+    async def close(self):
+        """Let in-flight requests finish, then shut down the session and its server process"""
+        self._retired = True
+        if self._task is None:
+            return
+        if not self._ready.done():
+            # Still in the handshake (start() timed out): nothing to drain
+            self._task.cancel()
+        else:
+            # Leaving the session cancels requests still waiting on a response
+            # without ever answering their callers, so an evicted backend is
+            # drained, and the requests that outlast the drain are failed
+            try:
+                await asyncio.wait_for(self._idle.wait(), BACKEND_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    f"Backend MCP server {self.key[0]} still had {len(self._requests)} "
+                    f"request(s) in flight after {BACKEND_DRAIN_TIMEOUT}s; closing it anyway"
+                )
+                self._aborted = True
+                for request in self._requests:
+                    request.cancel()
+        self._closing.set()
+        await asyncio.wait({self._task})
+
 class MCPProxyServer:
     def __init__(self):
         self.dispatcher = MCPDispatcher()
         self.logger = logging.getLogger('mcp_proxy_server')
-        self.server = Server("smart-mcp-dispatcher")
-        self.current_backend_session: Optional[ClientSession] = None
-        self.current_backend_config: Optional[Dict] = None
+        self.server = Server(SERVER_NAME, SERVER_VERSION)
+        # Running backends by key, least recently used first
+        self._backends: "OrderedDict[Tuple, BackendConnection]" = OrderedDict()
+        # Shutdowns running in the background; referenced so they are not collected
+        self._closing: set = set()
+        # Per backend key, serializes startup so concurrent requests spawn a
+        # server only once; one lock per configured server, so never pruned
+        self._spawn_locks: Dict[Tuple, asyncio.Lock] = {}
+        # Merged os.environ + server 'env', computed once per backend key. The
+        # proxy's environment is snapshotted on a backend's first start; later
+        # changes to os.environ are not seen by that backend.
+        self._backend_envs: Dict[Tuple, Dict[str, str]] = {}
+        # cwd -> resolved server_config, so repeat requests skip the dispatcher
+        self._cwd_cache: Dict[str, Dict] = {}
+        # Claude Code's working directory, reported through PWD. The proxy
+        # never changes directory and PWD is a snapshot taken at launch, so it
+        # is read once rather than per request.
+        self._current_path: str = os.environ.get('PWD') or os.getcwd()
         
-        # Set up handlers
-        self.server.list_tools = self.list_tools
-        self.server.call_tool = self.call_tool
-        self.server.list_prompts = self.list_prompts
-        self.server.get_prompt = self.get_prompt
+        # Set up handlers; the Server methods are decorator factories
+        for decorator, options, method in HANDLERS:
+            getattr(self.server, decorator)(**options)(getattr(self, method))
         
-    async def get_backend_session(self) -> ClientSession:
-        """Get or create backend MCP session for current directory"""
-        current_path = os.environ.get('PWD', os.getcwd())
-        server_config = self.dispatcher.find_matching_server(current_path)
+        # Capabilities follow from the registered handlers, so the options are
+        # built once here rather than on every run
+        self.init_options = InitializationOptions(
+            server_name=SERVER_NAME,
+            server_version=SERVER_VERSION,
+            capabilities=self.server.get_capabilities(
+                notification_options=NotificationOptions(),
+                experimental_capabilities={},
+            ),
+        )
+    
+    async def _get_backend(self) -> BackendConnection:
+        """Get or start the backend connection for the current directory"""
+        current_path = self._current_path
+        server_config = self._cwd_cache.get(current_path)
+        if server_config is None:
+            server_config = self.dispatcher.find_matching_server(current_path)
+            if len(self._cwd_cache) >= CWD_CACHE_SIZE:
+                # Drop the oldest entry to keep the cache bounded
+                del self._cwd_cache[next(iter(self._cwd_cache))]
+            self._cwd_cache[current_path] = server_config
         
         # If we already have a session for this server, reuse it
-        if (self.current_backend_session and 
-            self.current_backend_config == server_config):
-            return self.current_backend_session
+        key = self._backend_key(server_config)
+        backend = self._pooled_backend(key)
+        if backend is not None:
+            return backend
         
-        # Close existing session if any
-        if self.current_backend_session:
-            try:
-                await self.current_backend_session.__aexit__(None, None, None)
-            except:
-                pass
+        # Only requests for this server wait; other backends stay reachable
+        # while it starts
+        async with self._spawn_locks.setdefault(key, asyncio.Lock()):
+            # Another request may have started it while we waited for the lock
+            backend = self._pooled_backend(key)
+            if backend is not None:
+                return backend
+            return await self._start_backend(key, server_config)
+    
+    def _pooled_backend(self, key: Tuple) -> Optional[BackendConnection]:
+        """Return the running backend for key, retiring it if it has exited"""
+        backend = self._backends.get(key)
+        if backend is None:
+            return None
+        if backend.session is not None:
+            self._backends.move_to_end(key)
+            return backend
+        # The backend exited on its own; replace it
+        del self._backends[key]
+        self._close_in_background(backend)
+        return None
+    
+    async def _start_backend(self, key: Tuple, server_config: Dict) -> BackendConnection:
+        """Start a backend server and add it to the pool"""
+        # Make room before spawning, so the evicted server shuts down (once its
+        # in-flight requests are answered) while the new one starts
+        if len(self._backends) >= MAX_BACKEND_SESSIONS:
+            self._evict_backend()
         
         # Create new session
         self.logger.info(f"Starting backend MCP server: {server_config['name']}")
         
         try:
-            # Prepare environment variables
-            env = os.environ.copy()
-            if 'env' in server_config:
-                env.update(server_config['env'])
-            
             # Create server parameters
             server_params = StdioServerParameters(
                 command=server_config['command'],
                 args=server_config['args'],
-                env=env
+                env=self._backend_env(key, server_config)
             )
             
-            # Create session using context manager properly
-            session_context = stdio_client(server_params)
-            self.current_backend_session = await session_context.__aenter__()
-            self.current_backend_config = server_config
-            
-            return self.current_backend_session
-            
+            backend = BackendConnection(key, server_params)
+            try:
+                await backend.start(BACKEND_START_TIMEOUT)
+            except Exception:
+                # Reaps a server that is still stuck in its handshake
+                self._close_in_background(backend)
+                raise
         except Exception as e:
             self.logger.error(f"Failed to start backend MCP server: {e}")
             raise
+        
+        # Backends for other keys may have started meanwhile
+        while len(self._backends) >= MAX_BACKEND_SESSIONS:
+            self._evict_backend()
+        self._backends[key] = backend
+        return backend
+    
+    def _evict_backend(self):
+        """Shut down the least recently used backend in the background"""
+        _, evicted = self._backends.popitem(last=False)
+        self.logger.info(f"Stopping idle backend MCP server: {evicted.key[0]}")
+        self._close_in_background(evicted)
+    
+    def _close_in_background(self, backend: BackendConnection):
+        """Shut down a backend without making the current request wait for it"""
+        task = asyncio.ensure_future(backend.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+    
+    def _backend_key(self, server_config: Dict) -> Tuple:
+        """Stable identity of a backend server, cheap to hash and compare"""
+        # env is part of the identity: mappings may run the same server with
+        # different variables (e.g. per-project API tokens)
+        return (
+            server_config['name'],
+            server_config['command'],
+            tuple(server_config['args']),
+            tuple(sorted(server_config.get('env', {}).items())),
+        )
+    
+    def _backend_env(self, key: Tuple, server_config: Dict) -> Dict[str, str]:
+        """Environment for a backend server, merged once per backend key"""
+        env = self._backend_envs.get(key)
+        if env is None:
+            env = os.environ.copy()
+            env.update(server_config.get('env', {}))
+            self._backend_envs[key] = env
+        return env
+    
+    async def close(self):
+        """Shut down the backend servers, letting stdio_client reap their processes"""
+        backends = list(self._backends.values())
+        self._backends.clear()
+        await asyncio.gather(*(backend.close() for backend in backends), *self._closing)
     
     async def list_tools(self) -> List[Tool]:
         """Forward list_tools request to backend server"""
         try:
-            backend = await self.get_backend_session()
-            result = await backend.list_tools()
-            self.logger.info(f"Backend server provided {len(result.tools)} tools")
-            return result.tools
+            backend = await self._get_backend()
+            tools = await backend.list_tools()
+            self.logger.info(f"Backend server provided {len(tools)} tools")
+            return tools
         except Exception as e:
             self.logger.error(f"Error listing tools: {e}")
             return []
     
-    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> CallToolResult:
         """Forward call_tool request to backend server"""
         try:
-            backend = await self.get_backend_session()
-            result = await backend.call_tool(name, arguments)
-            return result.content
+            backend = await self._get_backend()
+            # Returned whole, so structured content and isError reach the client as is
+            return await backend.call("call_tool", name, arguments)
         except Exception as e:
             self.logger.error(f"Error calling tool {name}: {e}")
-            return [TextContent(type="text", text=f"Error calling tool {name}: {str(e)}")]
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Error calling tool {name}: {str(e)}")],
+                isError=True
+            )
     
     async def list_prompts(self) -> List[Prompt]:
         """Forward list_prompts request to backend server"""
         try:
-            backend = await self.get_backend_session()
-            result = await backend.list_prompts()
-            self.logger.info(f"Backend server provided {len(result.prompts)} prompts")
-            return result.prompts
+            backend = await self._get_backend()
+            prompts = await backend.list_prompts()
+            self.logger.info(f"Backend server provided {len(prompts)} prompts")
+            return prompts
         except Exception as e:
             self.logger.error(f"Error listing prompts: {e}")
             return []
     
-    async def get_prompt(self, name: str, arguments: Dict[str, str] = None) -> PromptMessage:
+    async def get_prompt(self, name: str, arguments: Dict[str, str] = None) -> GetPromptResult:
         """Forward get_prompt request to backend server"""
         try:
-            backend = await self.get_backend_session()
-            result = await backend.get_prompt(name, arguments or {})
-            return result
+            backend = await self._get_backend()
+            return await backend.call("get_prompt", name, arguments or {})
         except Exception as e:
             self.logger.error(f"Error getting prompt {name}: {e}")
-            return PromptMessage(
+            return GetPromptResult(messages=[PromptMessage(
                 role="user",
                 content=TextContent(type="text", text=f"Error getting prompt {name}: {str(e)}")
-            )
+            )])
 
 async def main():
     """Main function to run the MCP proxy server"""
@@ -149,19 +454,18 @@ async def main():
     proxy.logger.info("MCP Proxy Server starting...")
     
     # Run the server
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await proxy.server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="smart-mcp-dispatcher",
-                server_version="1.0.0",
-                capabilities=proxy.server.get_capabilities(
-                    notification_options=None,
-                    experimental_capabilities=None,
-                ),
-            ),
-        )
+    try:
+        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await proxy.server.run(read_stream, write_stream, proxy.init_options)
+    finally:
+        await proxy.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop is optional; the proxy only forwards stdio, which libuv does with
+    # far less per-iteration overhead than the default event loop
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
\ No newline at end of file
@@ -8,7 +8,6 @@ This script helps users configure their MCP dispatcher by:
 3. Validating the configuration
 """
 
-import json
 import os
 import sys
 import platform
@@ -71,9 +70,10 @@ def main():
         print("Please ensure you're running this from the project directory.")
         sys.exit(1)
     
+    from mcp_dispatcher_fast import dump_config, parse_config
+    
     # Load template
-    with open("config.json.template", 'r') as f:
-        config = json.load(f)
+    config = parse_config("config.json.template")
     
     print(f"\n📝 Let's configure your MCP dispatcher for {platform_info['name']}...")
     print("You need to provide:")
@@ -174,8 +174,7 @@ def main():
         })
     
     # Save configuration
-    with open("config.json", 'w') as f:
-        json.dump(config, f, indent=2)
+    dump_config("config.json", config)
     
     print("\n✅ Configuration saved to config.json")
     print("\n🧪 Testing your configuration...")
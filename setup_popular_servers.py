@@ -7,17 +7,37 @@ This script helps users quickly configure common MCP servers with the Smart MCP
 import os
 import sys
 import json
-import subprocess
+import shutil
+import functools
+import importlib
 from pathlib import Path
 from mcp_dispatcher import MCPDispatcher
 
+# Multi-line messages are written in one go rather than print()ed line by line
+BANNER = f"""\
+🚀 Smart MCP Dispatcher - Popular Servers Setup
+{"=" * 60}
+
+This script will help you quickly set up popular MCP servers.
+You can always add more servers later using 'mcp-dispatcher add'.
+
+"""
+
+NEXT_STEPS = """
+🎉 Setup complete!
+💡 Next steps:
+   1. Test your setup: mcp-dispatcher test-install
+   2. Test path routing: mcp-dispatcher test
+   3. Add more servers: mcp-dispatcher add
+   4. List all servers: mcp-dispatcher list
+"""
+
+@functools.lru_cache(maxsize=None)
 def check_command_available(command: str) -> bool:
     """Check if a command is available in PATH"""
-    try:
-        subprocess.run([command, '--version'], capture_output=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    # A PATH lookup, rather than running `command --version` (npx alone takes
+    # a noticeable Node.js startup), and each command is only looked up once
+    return shutil.which(command) is not None
 
 def get_user_input(prompt: str, default: str = "") -> str:
     """Get user input with optional default"""
@@ -80,7 +100,8 @@ def setup_zen_mcp(dispatcher: MCPDispatcher) -> bool:
         "zen-mcp",
         "npx",
         ["zen-mcp-server-199bio"],
-        "Zen MCP for development projects"
+        "Zen MCP for development projects",
+        save=False
     )
     
     print("✅ Zen MCP Server configured as default")
@@ -109,7 +130,8 @@ def setup_filesystem_mcp(dispatcher: MCPDispatcher) -> bool:
         "filesystem-mcp",
         "npx",
         ["@modelcontextprotocol/server-filesystem", allowed_dir],
-        "Filesystem operations for projects"
+        "Filesystem operations for projects",
+        save=False
     )
     
     print("✅ Filesystem MCP configured")
@@ -142,7 +164,8 @@ def setup_git_mcp(dispatcher: MCPDispatcher) -> bool:
         "git-mcp",
         "npx",
         ["@modelcontextprotocol/server-git", "--repository", git_dir],
-        "Git operations for repositories"
+        "Git operations for repositories",
+        save=False
     )
     
     print("✅ Git MCP configured")
@@ -167,7 +190,8 @@ def setup_browser_mcp(dispatcher: MCPDispatcher) -> bool:
         "browser-mcp",
         "npx",
         ["@modelcontextprotocol/server-browser"],
-        "Browser automation for web projects"
+        "Browser automation for web projects",
+        save=False
     )
     
     print("✅ Browser MCP configured")
@@ -196,7 +220,8 @@ def setup_sqlite_mcp(dispatcher: MCPDispatcher) -> bool:
         "sqlite-mcp",
         "npx",
         ["@modelcontextprotocol/server-sqlite"],
-        "SQLite operations for databases"
+        "SQLite operations for databases",
+        save=False
     )
     
     print("✅ SQLite MCP configured")
@@ -204,12 +229,7 @@ def setup_sqlite_mcp(dispatcher: MCPDispatcher) -> bool:
 
 def main():
     """Main setup function"""
-    print("🚀 Smart MCP Dispatcher - Popular Servers Setup")
-    print("=" * 60)
-    print()
-    print("This script will help you quickly set up popular MCP servers.")
-    print("You can always add more servers later using 'mcp-dispatcher add'.")
-    print()
+    sys.stdout.write(BANNER)
     
     try:
         # Initialize dispatcher
@@ -248,7 +268,7 @@ def main():
         if setup_sqlite_mcp(dispatcher):
             servers_configured += 1
         
-        # Save configuration
+        # Save configuration once; the setup_* helpers only update it in memory
         if servers_configured > 0:
             dispatcher._save_config()
             print(f"\n✅ Configuration saved with {servers_configured} MCP servers!")
@@ -260,17 +280,15 @@ def main():
             # Test installation
             print(f"\n🧪 Testing installation...")
             try:
-                subprocess.run([sys.executable, "-c", "from mcp_dispatcher import MCPDispatcher; print('✅ Dispatcher working')"], check=True)
+                # Re-import in this process instead of starting a new interpreter
+                sys.modules.pop('mcp_dispatcher', None)
+                importlib.import_module('mcp_dispatcher')
+                print('✅ Dispatcher working')
                 print("✅ Installation test passed!")
             except Exception as e:
                 print(f"⚠️  Installation test warning: {e}")
             
-            print(f"\n🎉 Setup complete!")
-            print(f"💡 Next steps:")
-            print(f"   1. Test your setup: mcp-dispatcher test-install")
-            print(f"   2. Test path routing: mcp-dispatcher test")
-            print(f"   3. Add more servers: mcp-dispatcher add")
-            print(f"   4. List all servers: mcp-dispatcher list")
+            sys.stdout.write(NEXT_STEPS)
         else:
             print("\n❌ No servers were configured.")
             print("Run this script again or use 'mcp-dispatcher add' to configure servers manually.")
@@ -7,61 +7,204 @@ This script validates the entire MCP dispatcher installation and configuration.
 import os
 import sys
 import json
+import importlib.util
+import shutil
+import signal
+import stat
 import subprocess
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
+
+from mcp_dispatcher_fast import parse_config
+
+# Candidate locations, expanded once at import rather than in every test
+CONFIG_PATHS = (
+    "config.json",
+    os.path.expanduser("~/.config/mcp_dispatcher/config.json"),
+    os.path.expanduser("~/.mcp_dispatcher_config.json"),
+)
+
+EXEC_PATHS = (
+    "/home/user/.local/bin/mcp-dispatcher-exec",
+    os.path.expanduser("~/.local/bin/mcp-dispatcher-exec"),
+    "mcp-dispatcher-exec",
+)
+
+CLAUDE_CONFIG_PATHS = (
+    os.path.expanduser("~/.config/claude-code/config.json"),
+    os.path.expanduser("~/Library/Application Support/ClaudeCode/config.json"),
+    os.path.expanduser("~/AppData/Roaming/ClaudeCode/config.json"),
+)
+
+# Printed by mcp-dispatcher-exec before it execs the server; matched against raw stderr
+STARTUP_MARKER = "🚀 Starting MCP server".encode()
+
+# Log level -> line prefix
+_PREFIX = {
+    "INFO": "ℹ️  ",
+    "SUCCESS": "✅ ",
+    "ERROR": "❌ ",
+    "WARNING": "⚠️  ",
+    "DEBUG": "🔍 ",
+}
+
+def _buffer_stdout():
+    """Stop flushing stdout on every newline; output is flushed once per test"""
+    # sys.stdout can be replaced by a stream without reconfigure()
+    reconfigure = getattr(sys.stdout, "reconfigure", None)
+    if reconfigure is not None:
+        reconfigure(line_buffering=False)
 
 class MCPDispatcherTester:
+    # (method name, label) in suite order; quick mode runs the first three
+    ALL_TESTS = (
+        ("test_python_dependencies", "Python Dependencies"),
+        ("test_cli_installation", "CLI Installation"),
+        ("test_configuration_file", "Configuration File"),
+        ("test_dispatcher_executable", "Dispatcher Executable"),
+        ("test_path_routing", "Path Routing"),
+        ("test_mcp_server_executability", "MCP Server Configuration"),
+        ("test_claude_code_integration", "Claude Code Integration"),
+        ("test_end_to_end", "End-to-End Functionality"),
+    )
+    QUICK_TESTS = ALL_TESTS[:3]
+    
     def __init__(self):
         self.tests_passed = 0
         self.tests_failed = 0
         self.failures = []
         self.verbose = False
+        # Quick mode stops at the first failed test; run_test sets _abort
+        self.quick_mode = False
+        self._abort = False
+        # Guards the counters above when tests run concurrently
+        self._lock = threading.Lock()
+        # Per-thread list that collects log lines while a test runs on a worker
+        self._output = threading.local()
+        # path -> os.path.exists result; paths do not change during a run
+        self._exists_cache: Dict[str, bool] = {}
+        # Explicit config location, read from the environment once
+        self._env_config = os.environ.get("MCP_DISPATCHER_CONFIG")
+        # absolute path -> ((mtime, size), parsed JSON)
+        self._config_cache: Dict[str, Tuple[tuple, Dict]] = {}
+        # Replies of the one `mcp-dispatcher batch` run shared by the routing
+        # and listing tests (None if it failed), filled in by _dispatcher_batch
+        self._batch: Optional[Dict] = None
+        self._batch_done = False
+        self._batch_lock = threading.Lock()
     
     def log(self, message: str, level: str = "INFO"):
         """Log test messages with levels"""
-        if level == "INFO":
-            print(f"ℹ️  {message}")
-        elif level == "SUCCESS":
-            print(f"✅ {message}")
-        elif level == "ERROR":
-            print(f"❌ {message}")
-        elif level == "WARNING":
-            print(f"⚠️  {message}")
-        elif level == "DEBUG" and self.verbose:
-            print(f"🔍 {message}")
+        prefix = _PREFIX.get(level)
+        if prefix is None or (level == "DEBUG" and not self.verbose):
+            return
+        self._emit(prefix + message)
     
-    def run_command(self, cmd: str, timeout: int = 10) -> Tuple[bool, str, str]:
-        """Run a command and return success, stdout, stderr"""
+    def _emit(self, line: str):
+        """Print a log line, or buffer it if the current test runs on a worker thread"""
+        lines = getattr(self._output, "lines", None)
+        if lines is None:
+            # One write per line instead of print's separate newline write
+            sys.stdout.write(line + "\n")
+        else:
+            lines.append(line)
+    
+    def _exists(self, path: str) -> bool:
+        """os.path.exists, checked once per path per run"""
+        exists = self._exists_cache.get(path)
+        if exists is None:
+            exists = self._exists_cache[path] = os.path.exists(path)
+        return exists
+    
+    def _first_existing(self, paths) -> Optional[str]:
+        """Return the first existing path, or None"""
+        return next((path for path in paths if self._exists(path)), None)
+    
+    def _load_json(self, path: str) -> Dict:
+        """Parse a JSON file, reusing the parsed result while the file is unchanged"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._config_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        # parse_config uses orjson when it is installed
+        config = parse_config(path)
+        self._config_cache[path] = (key, config)
+        return config
+    
+    def run_command(self, cmd: List[str], timeout: int = 10, binary: bool = False, input: Optional[str] = None) -> Tuple[bool, Union[str, bytes], Union[str, bytes]]:
+        """Run a command (argv list, no shell) and return success, stdout, stderr"""
+        # binary=True skips decoding output that is only checked for a return code or marker
         try:
             result = subprocess.run(
-                cmd, shell=True, capture_output=True, text=True, timeout=timeout
+                cmd, input=input, capture_output=True, text=not binary, timeout=timeout
             )
             return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", "Command timed out"
+        except subprocess.TimeoutExpired as e:
+            # Keep what the command wrote before it was killed: bytes on POSIX
+            # even with text=True, but already decoded on Windows
+            stderr = e.stderr or ""
+            if isinstance(stderr, bytes):
+                stderr = stderr.decode(errors="replace")
+            if stderr and not stderr.endswith("\n"):
+                stderr += "\n"
+            stderr += "Command timed out"
+            if binary:
+                return False, b"", stderr.encode()
+            return False, "", stderr
         except Exception as e:
+            if binary:
+                return False, b"", str(e).encode()
             return False, "", str(e)
     
+    def _dispatcher_batch(self) -> Optional[Dict]:
+        """Answers to the routing and listing queries from one `mcp-dispatcher batch` run"""
+        # The queries are known up front, so they are written in one go and read
+        # back under run_command's timeout; whichever test needs them first runs
+        # the batch and the other reuses the replies
+        with self._batch_lock:
+            if not self._batch_done:
+                self._batch = self._run_dispatcher_batch()
+                self._batch_done = True
+            return self._batch
+    
+    def _run_dispatcher_batch(self) -> Optional[Dict]:
+        # Current directory and a few specific paths
+        paths = [os.getcwd()] + [path for path in ("/tmp", "/home", "/usr") if self._exists(path)]
+        requests = [{"command": "test", "path": path} for path in paths] + [{"command": "list"}]
+        success, stdout, stderr = self.run_command(
+            ["mcp-dispatcher", "batch"],
+            input="".join(json.dumps(request) + "\n" for request in requests)
+        )
+        try:
+            replies = [json.loads(line) for line in stdout.splitlines()]
+        except ValueError:
+            replies = []
+        if not success or len(replies) != len(requests):
+            self.log(f"Dispatcher batch failed: {stderr}", "DEBUG")
+            return None
+        return {"routes": list(zip(paths, replies)), "list": replies[-1]}
+    
     def test_python_dependencies(self) -> bool:
         """Test that Python and required modules are available"""
         self.log("Testing Python dependencies...", "INFO")
         
-        # Test Python version
-        success, stdout, stderr = self.run_command("python3 --version")
-        if not success:
-            self.log("Python 3 not found in PATH", "ERROR")
+        # Checked in this interpreter rather than by starting python3 subprocesses
+        if sys.version_info < (3, 0):
+            self.log("Python 3 is required", "ERROR")
             return False
         
-        self.log(f"Python version: {stdout.strip()}", "DEBUG")
+        self.log(f"Python version: Python {sys.version.split()[0]}", "DEBUG")
         
         # Test required modules
         required_modules = ["json", "os", "sys", "subprocess", "fnmatch", "pathlib"]
         for module in required_modules:
-            success, _, stderr = self.run_command(f"python3 -c 'import {module}'")
-            if not success:
+            if importlib.util.find_spec(module) is None:
                 self.log(f"Required module '{module}' not available", "ERROR")
                 return False
         
@@ -72,17 +215,16 @@ class MCPDispatcherTester:
         """Test that mcp-dispatcher CLI is installed and accessible"""
         self.log("Testing CLI installation...", "INFO")
         
-        success, stdout, stderr = self.run_command("which mcp-dispatcher")
-        if not success:
+        cli_path = shutil.which("mcp-dispatcher")
+        if not cli_path:
             self.log("mcp-dispatcher not found in PATH", "ERROR")
             self.log("Run the installation script first", "WARNING")
             return False
         
-        cli_path = stdout.strip()
         self.log(f"CLI found at: {cli_path}", "DEBUG")
         
-        # Test CLI help
-        success, stdout, stderr = self.run_command("mcp-dispatcher --help")
+        # Test CLI help, now that we know it resolves
+        success, stdout, stderr = self.run_command(["mcp-dispatcher", "--help"], binary=True)
         if not success:
             self.log("mcp-dispatcher CLI not working", "ERROR")
             return False
@@ -95,20 +237,7 @@ class MCPDispatcherTester:
         self.log("Testing configuration file...", "INFO")
         
         # Check for config file
-        config_paths = [
-            "config.json",
-            os.path.expanduser("~/.config/mcp_dispatcher/config.json"),
-            os.path.expanduser("~/.mcp_dispatcher_config.json")
-        ]
-        
-        config_file = None
-        if os.environ.get("MCP_DISPATCHER_CONFIG"):
-            config_file = os.environ.get("MCP_DISPATCHER_CONFIG")
-        else:
-            for path in config_paths:
-                if os.path.exists(path):
-                    config_file = path
-                    break
+        config_file = self._env_config or self._first_existing(CONFIG_PATHS)
         
         if not config_file:
             self.log("No configuration file found", "ERROR")
@@ -119,8 +248,7 @@ class MCPDispatcherTester:
         
         # Validate config JSON
         try:
-            with open(config_file, 'r') as f:
-                config = json.load(f)
+            config = self._load_json(config_file)
         except Exception as e:
             self.log(f"Invalid configuration JSON: {e}", "ERROR")
             return False
@@ -145,18 +273,17 @@ class MCPDispatcherTester:
         """Test the dispatcher executable"""
         self.log("Testing dispatcher executable...", "INFO")
         
-        # Find the executable
-        exec_paths = [
-            "/home/user/.local/bin/mcp-dispatcher-exec",
-            os.path.expanduser("~/.local/bin/mcp-dispatcher-exec"),
-            "mcp-dispatcher-exec"
-        ]
-        
-        exec_file = None
-        for path in exec_paths:
-            if os.path.exists(path):
-                exec_file = path
-                break
+        # Find the executable; one stat per candidate covers existence and mode
+        exec_file = exec_stat = None
+        for path in EXEC_PATHS:
+            try:
+                exec_stat = os.stat(path)
+            except OSError:
+                continue
+            exec_file = path
+            break
+        else:
+            exec_file = shutil.which("mcp-dispatcher-exec")
         
         if not exec_file:
             self.log("mcp-dispatcher-exec not found", "ERROR")
@@ -164,8 +291,8 @@ class MCPDispatcherTester:
         
         self.log(f"Executable: {exec_file}", "DEBUG")
         
-        # Test that it's executable
-        if not os.access(exec_file, os.X_OK):
+        # Test that it's executable (shutil.which only returns executables)
+        if exec_stat is not None and not (stat.S_ISREG(exec_stat.st_mode) and exec_stat.st_mode & 0o111):
             self.log("mcp-dispatcher-exec is not executable", "ERROR")
             return False
         
@@ -176,21 +303,16 @@ class MCPDispatcherTester:
         """Test path-based routing functionality"""
         self.log("Testing path routing...", "INFO")
         
-        # Test current directory
-        success, stdout, stderr = self.run_command("mcp-dispatcher test")
-        if not success:
+        # Test current directory and specific paths
+        batch = self._dispatcher_batch()
+        if batch is None:
             self.log("Path routing test failed", "ERROR")
-            self.log(f"Error: {stderr}", "DEBUG")
             return False
-        
-        # Test specific paths from config
-        test_paths = ["/tmp", "/home", "/usr"]
-        for path in test_paths:
-            if os.path.exists(path):
-                success, stdout, stderr = self.run_command(f"mcp-dispatcher test --path {path}")
-                if not success:
-                    self.log(f"Path routing failed for {path}", "ERROR")
-                    return False
+        for path, reply in batch["routes"]:
+            if not reply.get("ok") or not reply.get("server"):
+                self.log(f"Path routing failed for {path}", "ERROR")
+                self.log(f"Error: {reply.get('error')}", "DEBUG")
+                return False
         
         self.log("Path routing OK", "SUCCESS")
         return True
@@ -200,13 +322,14 @@ class MCPDispatcherTester:
         self.log("Testing MCP server executability...", "INFO")
         
         # Get configuration
-        success, stdout, stderr = self.run_command("mcp-dispatcher list")
-        if not success:
+        batch = self._dispatcher_batch()
+        reply = batch and batch["list"]
+        if not reply or not reply.get("ok"):
             self.log("Could not list configured servers", "ERROR")
             return False
         
         # Try to validate at least one server exists
-        if "No path mappings configured" in stdout:
+        if not reply["path_mappings"]:
             self.log("No MCP servers configured - this is OK for basic setup", "WARNING")
             return True
         
@@ -218,17 +341,7 @@ class MCPDispatcherTester:
         self.log("Testing Claude Code integration...", "INFO")
         
         # Check for Claude Code config
-        claude_config_paths = [
-            os.path.expanduser("~/.config/claude-code/config.json"),
-            os.path.expanduser("~/Library/Application Support/ClaudeCode/config.json"),
-            os.path.expanduser("~/AppData/Roaming/ClaudeCode/config.json")
-        ]
-        
-        claude_config = None
-        for path in claude_config_paths:
-            if os.path.exists(path):
-                claude_config = path
-                break
+        claude_config = self._first_existing(CLAUDE_CONFIG_PATHS)
         
         if not claude_config:
             self.log("Claude Code config not found - manual configuration needed", "WARNING")
@@ -237,14 +350,12 @@ class MCPDispatcherTester:
         
         # Check if MCP dispatcher is configured
         try:
-            with open(claude_config, 'r') as f:
-                config = json.load(f)
+            config = self._load_json(claude_config)
             
-            if "mcp" in config and "servers" in config["mcp"]:
-                servers = config["mcp"]["servers"]
-                if any("dispatcher" in name.lower() for name in servers.keys()):
-                    self.log("Claude Code integration configured", "SUCCESS")
-                    return True
+            servers = config.get("mcp", {}).get("servers", {})
+            if any("dispatcher" in name.casefold() for name in servers):
+                self.log("Claude Code integration configured", "SUCCESS")
+                return True
         except Exception as e:
             self.log(f"Could not read Claude Code config: {e}", "WARNING")
         
@@ -255,77 +366,132 @@ class MCPDispatcherTester:
         """Test end-to-end functionality"""
         self.log("Testing end-to-end functionality...", "INFO")
         
-        # Test that the dispatcher can start (but don't let it run)
-        success, stdout, stderr = self.run_command("timeout 2 mcp-dispatcher-exec", timeout=5)
+        # Test that the dispatcher can start (but don't let it run). communicate()
+        # waits on the pipes, so a server that exits early ends the wait at once.
+        # The server gets its own session so that its children (node under npx),
+        # which inherit the pipes, are stopped along with it.
+        try:
+            proc = subprocess.Popen(
+                ["mcp-dispatcher-exec"], stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=True
+            )
+        except OSError as e:
+            stderr = str(e).encode()
+        else:
+            try:
+                _, stderr = proc.communicate(timeout=2)
+            except subprocess.TimeoutExpired as e:
+                stderr = e.stderr or b""
+                for sig in (signal.SIGTERM, getattr(signal, "SIGKILL", signal.SIGTERM)):
+                    self._signal_group(proc, sig)
+                    try:
+                        _, stderr = proc.communicate(timeout=1)
+                        break
+                    except subprocess.TimeoutExpired as e:
+                        stderr = e.stderr or stderr
+                else:
+                    # A process outside the group still holds the pipes; stop
+                    # waiting on them
+                    proc.stdout.close()
+                    proc.stderr.close()
+                    proc.wait()
         
         # We expect timeout or successful start
-        if "🚀 Starting MCP server" in stderr or "timeout" in stderr.lower():
+        if STARTUP_MARKER in stderr or b"timeout" in stderr.lower():
             self.log("End-to-end test OK", "SUCCESS")
             return True
         else:
             self.log("End-to-end test failed", "ERROR")
-            self.log(f"Output: {stderr}", "DEBUG")
+            self.log(f"Output: {stderr.decode(errors='replace')}", "DEBUG")
             return False
     
+    def _signal_group(self, proc: subprocess.Popen, sig: int):
+        """Signal a process started with start_new_session, and its children"""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(proc.pid, sig)
+            else:
+                # Windows has no process groups to signal; this terminates proc
+                proc.send_signal(sig)
+        except ProcessLookupError:
+            pass
+    
     def run_test(self, test_func, test_name: str) -> bool:
         """Run a single test and track results"""
         try:
             result = test_func()
-            if result:
-                self.tests_passed += 1
-            else:
-                self.tests_failed += 1
-                self.failures.append(test_name)
+            with self._lock:
+                if result:
+                    self.tests_passed += 1
+                else:
+                    self.tests_failed += 1
+                    self.failures.append(test_name)
+                    self._abort = self.quick_mode
             return result
         except Exception as e:
             self.log(f"Test {test_name} crashed: {e}", "ERROR")
-            self.tests_failed += 1
-            self.failures.append(f"{test_name} (crashed)")
+            with self._lock:
+                self.tests_failed += 1
+                self.failures.append(f"{test_name} (crashed)")
+                self._abort = self.quick_mode
             return False
     
+    def _run_buffered(self, test_func, test_name: str) -> List[str]:
+        """Run a test on a worker thread and return its log lines"""
+        lines = self._output.lines = []
+        try:
+            self.run_test(test_func, test_name)
+        finally:
+            self._output.lines = None
+        return lines
+    
     def run_all_tests(self, verbose: bool = False) -> bool:
         """Run all tests"""
         self.verbose = verbose
-        
-        print("🧪 Smart MCP Dispatcher - Comprehensive Test Suite")
-        print("=" * 60)
-        print()
-        
-        tests = [
-            (self.test_python_dependencies, "Python Dependencies"),
-            (self.test_cli_installation, "CLI Installation"), 
-            (self.test_configuration_file, "Configuration File"),
-            (self.test_dispatcher_executable, "Dispatcher Executable"),
-            (self.test_path_routing, "Path Routing"),
-            (self.test_mcp_server_executability, "MCP Server Configuration"),
-            (self.test_claude_code_integration, "Claude Code Integration"),
-            (self.test_end_to_end, "End-to-End Functionality")
-        ]
-        
-        for test_func, test_name in tests:
-            print(f"\n🔍 Testing: {test_name}")
-            self.run_test(test_func, test_name)
+        _buffer_stdout()
+        
+        sys.stdout.write("🧪 Smart MCP Dispatcher - Comprehensive Test Suite\n" + "=" * 60 + "\n\n")
+        
+        # The tests are independent and mostly wait on subprocesses, so they run
+        # concurrently; each test's output is printed in suite order once it is done
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            futures = [
+                (test_name, executor.submit(self._run_buffered, getattr(self, method), test_name))
+                for method, test_name in self.ALL_TESTS
+            ]
+            for test_name, future in futures:
+                lines = [f"\n🔍 Testing: {test_name}"] + future.result()
+                sys.stdout.write("\n".join(lines) + "\n")
+                sys.stdout.flush()
         
         # Summary
-        print("\n" + "=" * 60)
-        print("📊 TEST SUMMARY")
-        print("=" * 60)
-        print(f"✅ Tests Passed: {self.tests_passed}")
-        print(f"❌ Tests Failed: {self.tests_failed}")
-        
+        passed = self.tests_failed == 0
+        out = [
+            "",
+            "=" * 60,
+            "📊 TEST SUMMARY",
+            "=" * 60,
+            f"✅ Tests Passed: {self.tests_passed}",
+            f"❌ Tests Failed: {self.tests_failed}",
+        ]
         if self.failures:
-            print(f"\n🔍 Failed Tests:")
-            for failure in self.failures:
-                print(f"  • {failure}")
-        
-        if self.tests_failed == 0:
-            print(f"\n🎉 ALL TESTS PASSED!")
-            print(f"Your Smart MCP Dispatcher installation is working correctly!")
-            return True
+            # Tests finish in any order; failures are reported in suite order
+            order = {test_name: i for i, (_, test_name) in enumerate(self.ALL_TESTS)}
+            failures = sorted(
+                self.failures,
+                key=lambda failure: order.get(failure.replace(" (crashed)", ""), len(order))
+            )
+            out.append("\n🔍 Failed Tests:")
+            out += [f"  • {failure}" for failure in failures]
+        if passed:
+            out.append("\n🎉 ALL TESTS PASSED!")
+            out.append("Your Smart MCP Dispatcher installation is working correctly!")
         else:
-            print(f"\n⚠️  Some tests failed. Check the errors above.")
-            print(f"See documentation for troubleshooting guidance.")
-            return False
+            out.append("\n⚠️  Some tests failed. Check the errors above.")
+            out.append("See documentation for troubleshooting guidance.")
+        sys.stdout.write("\n".join(out) + "\n")
+        return passed
 
 def main():
     """Main test function"""
@@ -340,19 +506,19 @@ def main():
     tester = MCPDispatcherTester()
     
     if args.quick:
-        # Quick tests only
-        essential_tests = [
-            (tester.test_python_dependencies, "Python Dependencies"),
-            (tester.test_cli_installation, "CLI Installation"),
-            (tester.test_configuration_file, "Configuration File")
-        ]
-        
+        tester.quick_mode = True
+        _buffer_stdout()
         print("🚀 Smart MCP Dispatcher - Quick Test")
         print("=" * 40)
         
-        for test_func, test_name in essential_tests:
+        for method, test_name in tester.QUICK_TESTS:
             print(f"\n🔍 {test_name}")
-            tester.run_test(test_func, test_name)
+            tester.run_test(getattr(tester, method), test_name)
+            sys.stdout.flush()
+            if tester._abort:
+                # The environment is known to be broken; later checks would only fail too
+                print("\n⏭️  Skipping remaining quick tests")
+                break
         
         success = tester.tests_failed == 0
     else: